@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Traffic Replay - Ξαναστέλνει captured traffic (CAPTURE_FILE του simple_api_server.py)
+σε τοπικό server και συγκρίνει responses και latencies με το baseline.
+
+Usage:
+    python replay_traffic.py traffic_capture.jsonl --target http://localhost:8080 --speed 10
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import requests
+
+# Fields που αλλάζουν σε κάθε run (χρόνοι, delays) - δεν συγκρίνονται
+VOLATILE_FIELDS = {
+    "timestamp", "received_at", "age_seconds", "sender_delay", "last_update", "last_sync",
+    "last_error", "p50_ms", "p90_ms", "p99_ms", "max_ms", "sender_skew_seconds", "capture"
+}
+
+# Routes where the max-age (stale) decision depends on wall-clock timing
+TIME_DEPENDENT_ROUTES = {"GET /api/signal", "POST /api/sync"}
+
+
+def load_capture(path, route=None, client=None):
+    """Διαβάζει το capture file, προαιρετικά φιλτράρει ανά route/client (session).
+
+    Επιστρέφει (records, configs) - configs είναι τα config headers του server.
+    """
+    records = []
+    configs = []
+    with open(path, encoding='utf-8') as capture_file:
+        for line_number, line in enumerate(capture_file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"⚠️  Skipping invalid line {line_number}")
+                continue
+            if record.get("type") == "config":
+                configs.append(record.get("config") or {})
+                continue
+            if route and record.get("path") != route:
+                continue
+            if client and record.get("client") != client:
+                continue
+            records.append(record)
+    records.sort(key=lambda record: record["t"])
+    return records, configs
+
+
+def check_target_config(target, baseline_config):
+    """Συγκρίνει το config του target (GET /health) με το config του capture, επιστρέφει τις διαφορές"""
+    try:
+        target_config = requests.get(target.rstrip('/') + "/health", timeout=10).json().get("config")
+    except (requests.RequestException, ValueError) as e:
+        return [f"could not read target config: {e}"]
+    if target_config is None:
+        return ["target does not report its config (/health has no 'config')"]
+    return [f"{key}: baseline {baseline_config.get(key)!r} != target {target_config.get(key)!r}"
+            for key in sorted(set(baseline_config) | set(target_config))
+            if key != "replica_of" and baseline_config.get(key) != target_config.get(key)]
+
+
+def has_max_age(config):
+    return bool(config.get("signal_max_age_seconds") or config.get("signal_max_age_by_symbol")
+                or config.get("signal_max_age_by_magic"))
+
+
+def has_stale(value):
+    """True αν κάπου στο response υπάρχει "stale": true"""
+    if isinstance(value, dict):
+        return value.get("stale") is True or any(has_stale(item) for item in value.values())
+    if isinstance(value, list):
+        return any(has_stale(item) for item in value)
+    return False
+
+
+def normalize(value):
+    """Αφαιρεί τα volatile fields για deterministic σύγκριση"""
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items() if key not in VOLATILE_FIELDS}
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    return value
+
+
+def parse_json(text):
+    try:
+        return json.loads(text) if text else None
+    except ValueError:
+        return text
+
+
+def server_timing_ms(response):
+    """Server-side duration από το Server-Timing header (app;dur=1.234)"""
+    for metric in response.headers.get("Server-Timing", "").split(","):
+        for part in metric.split(";"):
+            if part.strip().startswith("dur="):
+                try:
+                    return float(part.strip()[4:])
+                except ValueError:
+                    return None
+    return None
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+
+def replay_client(client_records, target, speed, first_t, start_wall, options, results, lock):
+    """Worker ενός captured client: ακολουθεί το δικό του timeline με δικό του keep-alive session"""
+    session = requests.Session()
+
+    for index, record in client_records:
+        if speed > 0:
+            delay = (record["t"] - first_t) / speed - (time.perf_counter() - start_wall)
+            if delay > 0:
+                time.sleep(delay)
+
+        route = f"{record['method']} {record['path']}"
+        url = target.rstrip('/') + record["path"] + (f"?{record['query']}" if record.get("query") else "")
+        headers = {"ngrok-skip-browser-warning": "true"}
+        if record.get("content_type"):
+            headers["Content-Type"] = record["content_type"]
+
+        sent = time.perf_counter()
+        try:
+            response = session.request(record["method"], url, data=(record.get("body") or "").encode('utf-8'),
+                                        headers=headers, timeout=30)
+        except requests.RequestException as e:
+            with lock:
+                results["divergences"].append({"index": index, "route": route, "kind": "error", "detail": str(e)})
+            continue
+        latency_ms = server_timing_ms(response)
+        if latency_ms is None:
+            latency_ms = (time.perf_counter() - sent) * 1000  # Round trip if the server has no Server-Timing
+
+        found = []
+        if response.status_code != record.get("status"):
+            found.append({"index": index, "route": route, "kind": "status",
+                          "detail": f"baseline {record.get('status')} != replay {response.status_code}"})
+        elif "response" in record:
+            baseline_body = parse_json(record["response"])
+            replay_body = parse_json(response.text)
+            if normalize(baseline_body) != normalize(replay_body):
+                # At speed != 1 signal ages differ from the baseline, so stale decisions may too
+                time_dependent = speed != 1 and (
+                    (route in TIME_DEPENDENT_ROUTES and options["max_age_configured"])
+                    or has_stale(baseline_body) or has_stale(replay_body))
+                found.append({"index": index, "route": route, "kind": "stale-timing" if time_dependent else "body",
+                              "detail": f"baseline {record['response'][:200]} != replay {response.text[:200]}"})
+
+        baseline_ms = record.get("latency_ms", 0)
+        if latency_ms > baseline_ms * options["latency_factor"] + options["latency_slack_ms"]:
+            found.append({"index": index, "route": route, "kind": "latency",
+                          "detail": f"baseline {baseline_ms:.1f} ms -> replay {latency_ms:.1f} ms"})
+
+        with lock:
+            route_latencies = results["latencies"].setdefault(route, {"baseline": [], "replay": []})
+            route_latencies["baseline"].append(baseline_ms)
+            route_latencies["replay"].append(latency_ms)
+            results["divergences"].extend(found)
+
+
+def replay(records, target, speed, latency_factor, latency_slack_ms, max_age_configured=True):
+    """Ένας worker ανά captured client, όλοι στο κοινό timeline του capture.
+
+    Έτσι τα ταυτόχρονα polls πολλών receivers ξαναγίνονται ταυτόχρονα, όπως στο baseline.
+    Με speed=0 δεν υπάρχει timeline να κρατήσει τη σειρά μεταξύ clients, οπότε όλα τα
+    requests πάνε σειριακά (capture order, χωρίς αναμονή).
+    """
+    by_client = {}
+    for index, record in enumerate(records):
+        by_client.setdefault(record.get("client") if speed > 0 else None, []).append((index, record))
+
+    results = {"divergences": [], "latencies": {}}  # latencies: {route: {"baseline": [...], "replay": [...]}}
+    options = {"latency_factor": latency_factor, "latency_slack_ms": latency_slack_ms,
+               "max_age_configured": max_age_configured}
+    lock = threading.Lock()
+    first_t = records[0]["t"] if records else 0
+    start_wall = time.perf_counter()
+
+    workers = [threading.Thread(target=replay_client,
+                                args=(client_records, target, speed, first_t, start_wall, options, results, lock))
+               for client_records in by_client.values()]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    divergences = sorted(results["divergences"], key=lambda divergence: divergence["index"])
+    return divergences, results["latencies"], len(by_client)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured API traffic against a local server")
+    parser.add_argument("capture_file", help="CAPTURE_FILE written by simple_api_server.py")
+    parser.add_argument("--target", default="http://localhost:8080", help="Server to replay against")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 = real time, 10 = 10x faster (one worker per client), 0 = serial, no waiting")
+    parser.add_argument("--route", help="Only replay this path (e.g. /api/signal)")
+    parser.add_argument("--client", help="Only replay this client's session (remote address)")
+    parser.add_argument("--latency-factor", type=float, default=2.0, help="Latency divergence: replay > baseline * factor + slack")
+    parser.add_argument("--latency-slack-ms", type=float, default=50.0, help="Absolute latency slack in ms")
+    parser.add_argument("--max-report", type=int, default=20, help="Max divergences to print")
+    args = parser.parse_args()
+
+    records, configs = load_capture(args.capture_file, route=args.route, client=args.client)
+    print("=" * 70)
+    print(f"📼 Replaying {len(records)} request(s) from {args.capture_file}")
+    print(f"🎯 Target: {args.target}  ⏩ Speed: {'max' if args.speed <= 0 else f'{args.speed}x'}")
+    print("=" * 70)
+    if not records:
+        return 0
+
+    baseline_config = configs[-1] if configs else None
+    if baseline_config is None:
+        print("⚠️  Capture has no config header - cannot check the target's settings")
+    else:
+        if len({json.dumps(config, sort_keys=True) for config in configs}) > 1:
+            print(f"⚠️  Capture spans {len(configs)} server runs with different configs - comparing with the last one")
+        for difference in check_target_config(args.target, baseline_config):
+            print(f"⚠️  Config differs from baseline: {difference}")
+
+    divergences, latencies, clients = replay(records, args.target, args.speed, args.latency_factor,
+                                             args.latency_slack_ms,
+                                             max_age_configured=has_max_age(baseline_config or {}))
+    print(f"👥 {clients} concurrent worker(s)" + (" (serial replay at max speed)" if args.speed <= 0 else ""))
+
+    print(f"{'Route':<32} {'Count':>6} {'Base p50':>9} {'Repl p50':>9} {'Base p95':>9} {'Repl p95':>9}")
+    for route, samples in sorted(latencies.items()):
+        print(f"{route:<32} {len(samples['replay']):>6} "
+              f"{percentile(samples['baseline'], 0.5):>9} {percentile(samples['replay'], 0.5):>9} "
+              f"{percentile(samples['baseline'], 0.95):>9} {percentile(samples['replay'], 0.95):>9}")
+
+    print("=" * 70)
+    # Stale decisions depend on wall-clock timing - reported, but not counted as regressions
+    timing = [divergence for divergence in divergences if divergence["kind"] == "stale-timing"]
+    divergences = [divergence for divergence in divergences if divergence["kind"] != "stale-timing"]
+    if timing:
+        print(f"ℹ️  {len(timing)} time-dependent (stale/max-age) difference(s) ignored at speed {args.speed}x")
+    if not divergences:
+        print("✅ No divergences from baseline")
+        return 0
+
+    kinds = {}
+    for divergence in divergences:
+        kinds[divergence["kind"]] = kinds.get(divergence["kind"], 0) + 1
+    print(f"❌ {len(divergences)} divergence(s): {kinds}")
+    for divergence in divergences[:args.max_report]:
+        print(f"  #{divergence['index']} {divergence['route']} [{divergence['kind']}] {divergence['detail']}")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
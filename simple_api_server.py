@@ -3,10 +3,16 @@
 Simple API Server - Τρέχει στο web (VPS ή cloud)
 Δέχεται signals από το bridge server και τα δίνει στο client
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 from datetime import datetime
 import threading
 import sys
+import os
+import json
+import gzip
+import time
+import queue
+from collections import deque
 from werkzeug.formparser import parse_form_data
 
 app = Flask(__name__)
@@ -14,6 +20,71 @@ app = Flask(__name__)
 # Configure Flask to handle form data even with incorrect Content-Type
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 
+# Traffic capture (opt-in): CAPTURE_FILE=traffic_capture.jsonl
+# Κάθε request γράφεται ως JSON line από background thread - το request path δεν μπλοκάρει ποτέ.
+CAPTURE_FILE = os.environ.get('CAPTURE_FILE', '')
+CAPTURE_QUEUE_SIZE = int(os.environ.get('CAPTURE_QUEUE_SIZE', 10000))
+capture_queue = queue.Queue(maxsize=CAPTURE_QUEUE_SIZE)
+capture_stats = {"captured": 0, "dropped": 0}
+capture_stats_lock = threading.Lock()
+
+def capture_writer_loop():
+    """Background thread: γράφει τα captured requests στο CAPTURE_FILE"""
+    with open(CAPTURE_FILE, 'a', encoding='utf-8') as capture_file:
+        # Config header: replay_traffic.py checks the replay target against it
+        header = {"type": "config", "t": round(time.time(), 6), "config": server_config()}
+        capture_file.write(json.dumps(header, separators=(',', ':'), ensure_ascii=False) + '\n')
+        capture_file.flush()
+        while True:
+            record = capture_queue.get()
+            capture_file.write(json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n')
+            with capture_stats_lock:
+                capture_stats["captured"] += 1
+            if capture_queue.empty():
+                capture_file.flush()
+
+# Registered first so the raw body is cached before force_form_parsing consumes the stream
+@app.before_request
+def capture_request_start():
+    """Σημειώνει arrival time και raw body για το traffic capture"""
+    g.request_start = time.perf_counter()  # Also used for the Server-Timing header
+    if not CAPTURE_FILE:
+        return
+    g.capture_arrival = time.time()
+    g.capture_body = request.get_data(cache=True, as_text=True)
+
+@app.after_request
+def capture_request_end(response):
+    """Βάζει το request (και το JSON response για baseline) στην capture queue"""
+    if 'request_start' not in g:
+        return response
+    latency_ms = (time.perf_counter() - g.request_start) * 1000
+    # Server-side time, so replay_traffic.py can compare without client/network overhead
+    response.headers['Server-Timing'] = f"app;dur={latency_ms:.3f}"
+    if not CAPTURE_FILE:
+        return response
+    
+    record = {
+        "t": round(g.capture_arrival, 6),
+        "method": request.method,
+        "path": request.path,
+        "query": request.query_string.decode('utf-8', 'replace'),
+        "content_type": request.content_type,
+        "body": g.capture_body,
+        "client": request.remote_addr,
+        "status": response.status_code,
+        "latency_ms": round(latency_ms, 3)
+    }
+    # 204 responses carry no body on the wire
+    if response.is_json and response.status_code != 204 and not response.headers.get('Content-Encoding'):
+        record["response"] = response.get_data(as_text=True)
+    try:
+        capture_queue.put_nowait(record)
+    except queue.Full:
+        with capture_stats_lock:
+            capture_stats["dropped"] += 1
+    return response
+
 # Middleware to force form parsing for form-encoded data
 @app.before_request
 def force_form_parsing():
@@ -24,6 +95,9 @@ def force_form_parsing():
             # Access request.form to trigger Flask's form parser
             # This ensures form data is available even if Content-Type was set incorrectly
             try:
+                # Cache the raw body first so get_data() still returns it after form parsing
+                # (JSON sent with a form Content-Type is parsed from the raw body, not request.form)
+                request.get_data(cache=True)
                 _ = request.form  # Trigger form parsing
             except Exception:
                 pass  # Ignore parsing errors, we'll handle manually
@@ -94,6 +168,157 @@ signal_history = []  # Store last 10 signals for debugging
 signal_lock = threading.Lock()
 MAX_HISTORY = 10
 
+# Replication (hot standby via log shipping)
+# Ένας follower (REPLICA_OF=http://primary:8080) κάνει tail το signal log του primary
+# και κρατάει το ίδιο id space, ώστε να μπορεί να γίνει promote χωρίς id regression.
+REPLICA_OF = os.environ.get('REPLICA_OF', '').rstrip('/')
+REPLICATION_LOG_SIZE = int(os.environ.get('REPLICATION_LOG_SIZE', 1000))
+REPLICATION_BATCH_SIZE = int(os.environ.get('REPLICATION_BATCH_SIZE', 200))
+if REPLICATION_BATCH_SIZE < 1:
+    raise ValueError(f"REPLICATION_BATCH_SIZE must be >= 1 (got {REPLICATION_BATCH_SIZE})")
+REPLICATION_POLL_INTERVAL = float(os.environ.get('REPLICATION_POLL_INTERVAL', 0.5))
+replication_log = []  # Last REPLICATION_LOG_SIZE signals, ordered by id
+server_role = "follower" if REPLICA_OF else "primary"  # Protected by signal_lock
+replication_status = {
+    "primary": REPLICA_OF or None,
+    "last_sync": None,
+    "last_error": None,
+    "batches_applied": 0,
+    "diverged": False  # Follower stopped: primary timeline no longer matches (operator must act)
+}
+
+def store_signal_locked(entry):
+    """Αποθηκεύει ένα signal σε latest/history/replication log (caller holds signal_lock)"""
+    global latest_signal
+    latest_signal = entry
+    signal_history.append(entry.copy())
+    if len(signal_history) > MAX_HISTORY:
+        signal_history.pop(0)
+    replication_log.append(entry.copy())
+    if len(replication_log) > REPLICATION_LOG_SIZE:
+        replication_log.pop(0)
+
+# Signal freshness tracking
+# Το TIME= του sender είναι σε ώρα του trade server (broker). Με BROKER_UTC_OFFSET_SECONDS
+# το delay υπολογίζεται απευθείας. Αλλιώς το skew ανά sender εκτιμάται ως το ελάχιστο
+# (server receive - sender TIME) και το delay είναι άγνωστο (None) μέχρι SKEW_MIN_SAMPLES samples.
+# Limitation: χωρίς offset, αν όλα τα πρώτα signals ενός sender είναι παλιά (π.χ. resend μετά από
+# restart) το ελάχιστο είναι ήδη "παλιό" και αυτά τα signals δεν αναγνωρίζονται ως stale.
+def parse_max_age_map(value):
+    """Parses 'XAUUSD=5,EURUSD=10' into {'XAUUSD': 5.0, 'EURUSD': 10.0}"""
+    result = {}
+    for item in value.split(','):
+        if '=' in item:
+            key, seconds = item.split('=', 1)
+            result[key.strip()] = float(seconds)
+    return result
+
+SIGNAL_MAX_AGE_SECONDS = float(os.environ.get('SIGNAL_MAX_AGE_SECONDS', 0))  # 0 = no limit
+SIGNAL_MAX_AGE_BY_SYMBOL = parse_max_age_map(os.environ.get('SIGNAL_MAX_AGE_BY_SYMBOL', ''))
+SIGNAL_MAX_AGE_BY_MAGIC = parse_max_age_map(os.environ.get('SIGNAL_MAX_AGE_BY_MAGIC', ''))  # Per channel
+STALE_SIGNAL_POLICY = os.environ.get('STALE_SIGNAL_POLICY', 'drop')  # "drop" or "flag"
+LATENCY_SAMPLES = int(os.environ.get('LATENCY_SAMPLES', 1000))
+SKEW_SAMPLES = 100
+SKEW_MIN_SAMPLES = int(os.environ.get('SKEW_MIN_SAMPLES', 5))
+# e.g. 7200 for UTC+2, unset = estimate (a malformed value fails here, at startup)
+BROKER_UTC_OFFSET_SECONDS = (float(os.environ['BROKER_UTC_OFFSET_SECONDS'])
+                             if os.environ.get('BROKER_UTC_OFFSET_SECONDS') else None)
+sender_delays = deque(maxlen=LATENCY_SAMPLES)    # Sender -> server (skew corrected), seconds
+delivery_delays = deque(maxlen=LATENCY_SAMPLES)  # Server -> receiver, seconds
+sender_offsets = {}  # {sender: deque of raw (receive - sender TIME) offsets}
+stale_signal_ids = deque(maxlen=100)  # Ids already counted as stale
+stale_stats = {"dropped": 0, "flagged": 0}
+latency_lock = threading.Lock()
+
+def parse_signal_fields(signal):
+    """ACTION=OPEN|SYMBOL=XAUUSD|... -> {'ACTION': 'OPEN', 'SYMBOL': 'XAUUSD', ...}"""
+    fields = {}
+    for part in signal.split('|'):
+        if '=' in part:
+            key, value = part.split('=', 1)
+            fields[key.strip()] = value.strip()
+    return fields
+
+def track_sender_delay(fields, received_at):
+    """Καταγράφει sender -> server delay, επιστρέφει (sender, delay) ή (sender, None)"""
+    sender = fields.get('MAGIC') or request.remote_addr
+    try:
+        sender_time = float(fields['TIME'])
+    except (KeyError, ValueError):
+        return sender, None
+    
+    with latency_lock:
+        offsets = sender_offsets.setdefault(sender, deque(maxlen=SKEW_SAMPLES))
+        offsets.append(received_at - sender_time)
+        if BROKER_UTC_OFFSET_SECONDS is not None:
+            delay = max(0.0, offsets[-1] + BROKER_UTC_OFFSET_SECONDS)
+        elif len(offsets) >= SKEW_MIN_SAMPLES:
+            delay = offsets[-1] - min(offsets)
+        else:
+            return sender, None  # Skew not known yet - a 0 delay would make old signals look fresh
+        sender_delays.append(delay)
+    return sender, delay
+
+def max_age_for(fields):
+    """Max age για το signal: per symbol > per channel (MAGIC) > default (0 = no limit)"""
+    symbol = fields.get('SYMBOL')
+    if symbol in SIGNAL_MAX_AGE_BY_SYMBOL:
+        return SIGNAL_MAX_AGE_BY_SYMBOL[symbol]
+    magic = fields.get('MAGIC')
+    if magic in SIGNAL_MAX_AGE_BY_MAGIC:
+        return SIGNAL_MAX_AGE_BY_MAGIC[magic]
+    return SIGNAL_MAX_AGE_SECONDS
+
+def check_signal_freshness(signal):
+    """Ελέγχει το max age του signal και καταγράφει server -> receiver delay όταν παραδίδεται.
+
+    Προσθέτει age_seconds (και stale=True στο flag policy) στο signal.
+    Επιστρέφει False αν το signal πρέπει να μην παραδοθεί (drop policy).
+    Χωρίς γνωστό sender delay, το age είναι μόνο ο χρόνος από τη λήψη στον server.
+    """
+    received_at = signal.get("received_at")
+    if received_at is None:
+        return True  # Signal stored before freshness tracking (e.g. old replica entry)
+    
+    delivery_delay = time.time() - received_at
+    age = delivery_delay + (signal.get("sender_delay") or 0)
+    signal["age_seconds"] = round(age, 3)
+    
+    fields = parse_signal_fields(signal.get("signal", ""))
+    max_age = max_age_for(fields)
+    # Only OPEN signals are suppressed - a late CLOSE is still better than none
+    is_stale = max_age > 0 and age > max_age and fields.get("ACTION", "OPEN") == "OPEN"
+    
+    dropped = is_stale and STALE_SIGNAL_POLICY == "drop"
+    with latency_lock:
+        if not dropped:
+            delivery_delays.append(delivery_delay)
+        if is_stale and signal["id"] not in stale_signal_ids:
+            stale_signal_ids.append(signal["id"])
+            stale_stats["dropped" if STALE_SIGNAL_POLICY == "drop" else "flagged"] += 1
+    
+    if is_stale:
+        signal["stale"] = True
+    return not dropped
+
+def percentiles(samples):
+    """p50/p90/p99/max σε milliseconds"""
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+    return {
+        "count": len(ordered),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 1)
+    }
+
+# Combined receiver sync (POST /api/sync)
+SYNC_MAX_SIGNALS = int(os.environ.get('SYNC_MAX_SIGNALS', 50))
+SYNC_POLL_INTERVAL_MS = int(os.environ.get('SYNC_POLL_INTERVAL_MS', 0))  # Hint to receivers, 0 = no hint
+
 # Store account monitoring data
 accounts_data = {}  # {account_id: {balance, trades, last_update, etc}}
 accounts_lock = threading.Lock()
@@ -103,6 +328,10 @@ def receive_signal():
     """Δέχεται signal από το bridge server"""
     global latest_signal, signal_counter
     
+    if server_role == "follower":
+        print(f"  ⛔ Rejecting signal: this server is a read-only follower of {REPLICA_OF}")
+        return jsonify({"error": "Server is a read-only follower", "primary": REPLICA_OF}), 503
+    
     try:
         signal = None
         raw_data = None
@@ -191,19 +420,23 @@ def receive_signal():
             print(f"  ❌ Failed to parse signal. Debug info: {error_info}")
             return jsonify(error_info), 400
         
+        received_at = time.time()
+        sender, sender_delay = track_sender_delay(parse_signal_fields(signal), received_at)
+        
         with signal_lock:
             signal_counter += 1
-            latest_signal = {
+            store_signal_locked({
                 "id": signal_counter,
                 "signal": signal,
-                "timestamp": datetime.now().isoformat()
-            }
-            # Add to history
-            signal_history.append(latest_signal.copy())
-            if len(signal_history) > MAX_HISTORY:
-                signal_history.pop(0)
+                "timestamp": datetime.now().isoformat(),
+                "received_at": received_at,
+                "sender": sender,
+                "sender_delay": sender_delay
+            })
         
         print(f"  💾 Signal #{signal_counter} stored in memory")
+        if sender_delay is not None:
+            print(f"  ⏱️  Sender {sender} delay: {sender_delay * 1000:.0f} ms (skew corrected)")
         print(f"  📊 Total signals received: {signal_counter}")
         print(f"  📝 Signal content: {signal[:100]}...")
         return jsonify({"status": "ok", "id": signal_counter}), 200
@@ -222,12 +455,25 @@ def get_signal():
     global latest_signal
     
     last_id = request.args.get('last_id', type=int)
+    signal = None
     
     with signal_lock:
+        # A follower that lags behind the receiver must not hand out an older signal
+        if server_role == "follower" and latest_signal and last_id is not None and latest_signal["id"] < last_id:
+            print(f"  ⏳ Replica behind client (client last_id: {last_id}, replica latest: {latest_signal['id']})")
+            return jsonify({"message": "Replica behind client"}), 204
         if latest_signal and latest_signal["id"] != last_id:
-            print(f"  📤 Returning signal #{latest_signal['id']} to client")
-            print(f"  📝 Signal: {latest_signal.get('signal', '')[:80]}...")
-            return jsonify(latest_signal), 200
+            signal = dict(latest_signal)
+    
+    if signal:
+        if not check_signal_freshness(signal):
+            print(f"  🗑️  Stale signal #{signal['id']} dropped (age {signal['age_seconds']}s)")
+            # 200 with id (no signal text) so the receiver moves its cursor past it
+            return jsonify({"message": "Stale signal suppressed", "id": signal["id"],
+                            "stale": True, "dropped": True, "age_seconds": signal["age_seconds"]}), 200
+        print(f"  📤 Returning signal #{signal['id']} to client (age {signal['age_seconds']}s)")
+        print(f"  📝 Signal: {signal.get('signal', '')[:80]}...")
+        return jsonify(signal), 200
     
     print(f"  ℹ️  No new signal (client last_id: {last_id}, server latest: {latest_signal['id'] if latest_signal else 'None'})")
     return jsonify({"message": "No new signal"}), 204
@@ -242,6 +488,10 @@ def root():
             "POST /api/signal": "Receive signals from SignalSender",
             "GET /api/signal": "Get latest signal for SignalReceiver",
             "GET /api/signals/history": "Get signal history",
+            "POST /api/sync": "Receiver sync: account status + last_id -> pending signals + hints",
+            "GET /api/latency": "Signal delay percentiles, sender clock skew, stale counters",
+            "GET /api/replication/log": "Signal log batch for followers (after=<id>&limit=<n>)",
+            "POST /api/replication/promote": "Promote a follower to primary",
             "GET /health": "Health check"
         },
         "status": "running"
@@ -253,10 +503,14 @@ def health():
     print(f"  💚 Health check - Server is running")
     print(f"  📊 Total signals received: {signal_counter}")
     return jsonify({
-        "status": "ok",
+        "status": "diverged" if replication_status["diverged"] else "ok",
         "server": "MT5 Signal Bridge API",
+        "role": server_role,
         "signals_received": signal_counter,
-        "latest_signal_id": latest_signal["id"] if latest_signal else None
+        "latest_signal_id": latest_signal["id"] if latest_signal else None,
+        "replication": replication_status if REPLICA_OF else None,
+        "capture": dict(capture_stats, file=CAPTURE_FILE) if CAPTURE_FILE else None,
+        "config": server_config()
     }), 200
 
 @app.route('/api/signals/history', methods=['GET'])
@@ -271,70 +525,224 @@ def get_signal_history():
             "total_received": signal_counter
         }), 200
 
-@app.route('/api/account/status', methods=['POST'])
-def receive_account_status():
-    """Δέχεται account status από SignalReceiver instances"""
-    global accounts_data
+@app.route('/api/latency', methods=['GET'])
+def get_latency():
+    """Delay percentiles (sender -> server, server -> receiver), skew ανά sender, stale counters"""
+    with latency_lock:
+        return jsonify({
+            "sender_to_server": percentiles(sender_delays),
+            "server_to_receiver": percentiles(delivery_delays),
+            "sender_skew_seconds": {sender: round(min(offsets), 3) for sender, offsets in sender_offsets.items()},
+            "stale": dict(stale_stats),
+            "max_age": {
+                "default_seconds": SIGNAL_MAX_AGE_SECONDS,
+                "by_symbol": SIGNAL_MAX_AGE_BY_SYMBOL,
+                "by_magic": SIGNAL_MAX_AGE_BY_MAGIC,
+                "policy": STALE_SIGNAL_POLICY
+            },
+            "skew": {
+                "broker_utc_offset_seconds": BROKER_UTC_OFFSET_SECONDS,
+                "min_samples": SKEW_MIN_SAMPLES
+            }
+        }), 200
+
+@app.route('/api/replication/log', methods=['GET'])
+def get_replication_log():
+    """Επιστρέφει batch από signals μετά το cursor (after) για τους followers"""
+    after = request.args.get('after', 0, type=int)
+    limit = max(1, min(request.args.get('limit', REPLICATION_BATCH_SIZE, type=int), REPLICATION_LOG_SIZE))
     
-    try:
-        # Try to get JSON data - handle both JSON and form-encoded
-        data = None
+    with signal_lock:
+        entries = [entry for entry in replication_log if entry["id"] > after][:limit]
+        oldest_id = replication_log[0]["id"] if replication_log else None
+        payload = {
+            "role": server_role,
+            "latest_id": signal_counter,
+            "server_time": time.time(),  # Lets followers on other hosts correct received_at for clock offset
+            "oldest_id": oldest_id,
+            # Follower fell behind the retained log - some ids cannot be shipped
+            "truncated": oldest_id is not None and after < oldest_id - 1,
+            "entries": entries
+        }
+    
+    print(f"  🔁 Replication batch: after={after}, entries={len(entries)}, latest={payload['latest_id']}")
+    body = json.dumps(payload).encode('utf-8')
+    response = Response(body, status=200, mimetype='application/json')
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(body))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route('/api/replication/promote', methods=['POST'])
+def promote_replica():
+    """Κάνει promote τον follower σε primary (σταματάει το tailing, κρατάει το id space)"""
+    global server_role
+    
+    with signal_lock:
+        previous_role = server_role
+        server_role = "primary"
+        # Promotion is the operator's answer to a divergence - the new primary is healthy
+        replication_status["diverged"] = False
+        replication_status["last_error"] = None
+        current_id = signal_counter
+    
+    if previous_role == "follower":
+        print(f"  👑 Promoted to primary at signal #{current_id} (was following {REPLICA_OF})")
+    return jsonify({"status": "ok", "role": "primary", "previous_role": previous_role, "latest_id": current_id}), 200
+
+def apply_replication_batch(batch):
+    """Εφαρμόζει ένα batch από τον primary, επιστρέφει πόσα signals εφαρμόστηκαν"""
+    global signal_counter
+    applied = 0
+    now = time.time()
+    # received_at is the primary's clock: shift it onto ours so age_seconds (and stale
+    # decisions) do not depend on the clock offset between hosts
+    clock_offset = now - batch["server_time"] if batch.get("server_time") else None
+    
+    with signal_lock:
+        if server_role != "follower":
+            return 0  # Promoted while the batch was in flight
+        for entry in batch.get("entries", []):
+            if entry["id"] <= signal_counter:
+                continue
+            if entry.get("received_at") is not None:
+                entry["received_at"] = entry["received_at"] + clock_offset if clock_offset is not None else now
+            signal_counter = entry["id"]
+            store_signal_locked(entry)
+            applied += 1
+    return applied
+
+def replication_follower_loop():
+    """Background thread: κάνει tail το signal log του primary μέχρι το promote"""
+    import requests
+    session = requests.Session()  # Keep-alive; requests asks for gzip by default
+    url = f"{REPLICA_OF}/api/replication/log"
+    
+    while True:
+        with signal_lock:
+            if server_role != "follower":
+                print("  🔁 Replication stopped (promoted to primary)")
+                return
+            cursor = signal_counter
         
-        # Try JSON first
-        if request.is_json or request.content_type == 'application/json':
-            data = request.get_json(silent=True, force=True)
+        caught_up = True
+        try:
+            response = session.get(url, params={"after": cursor, "limit": REPLICATION_BATCH_SIZE},
+                                   headers={"ngrok-skip-browser-warning": "true"}, timeout=10)
+            response.raise_for_status()
+            batch = response.json()
+            
+            # Applying anything now would mix two timelines (restarted primary) or skip ids (gap).
+            # A fresh follower (cursor 0) may start from the oldest retained entry.
+            divergence = None
+            if batch.get("latest_id", 0) < cursor:
+                divergence = f"Primary id (#{batch.get('latest_id')}) is behind follower (#{cursor}) - primary restarted?"
+            elif batch.get("truncated") and cursor > 0:
+                divergence = f"Replication gap: primary log starts at #{batch.get('oldest_id')}, follower was at #{cursor}"
+            if divergence:
+                replication_status["diverged"] = True
+                replication_status["last_error"] = divergence
+                print(f"  ❌ {divergence}")
+                print(f"  ❌ Replication STOPPED - promote this follower or restart it against the current primary")
+                return
+            
+            applied = apply_replication_batch(batch)
+            replication_status["last_sync"] = datetime.now().isoformat()
+            replication_status["last_error"] = None
+            if applied:
+                replication_status["batches_applied"] += 1
+                print(f"  🔁 Replicated {applied} signal(s), now at #{signal_counter}")
+            caught_up = signal_counter >= batch.get("latest_id", 0)
+        except Exception as e:
+            replication_status["last_error"] = str(e)
+            print(f"  ⚠️  Replication from {REPLICA_OF} failed: {e}")
         
-        # If not JSON, try raw data FIRST (MT5 WebRequest sometimes sends JSON with wrong Content-Type)
-        if not data:
-            raw_data = request.get_data(as_text=True)
-            if raw_data:
-                import json
+        if caught_up:
+            time.sleep(REPLICATION_POLL_INTERVAL)
+
+def parse_json_body():
+    """Διαβάζει JSON body - handle both JSON and form-encoded (MT5 WebRequest)"""
+    data = None
+    
+    # Try JSON first
+    if request.is_json or request.content_type == 'application/json':
+        data = request.get_json(silent=True, force=True)
+    
+    # If not JSON, try raw data FIRST (MT5 WebRequest sometimes sends JSON with wrong Content-Type)
+    if not data:
+        raw_data = request.get_data(as_text=True)
+        if raw_data:
+            try:
+                # Try to parse as JSON directly
+                data = json.loads(raw_data)
+                print(f"  📥 Parsed JSON from raw data (Content-Type was: {request.content_type})")
+            except Exception as e:
+                # If not valid JSON, try form-encoded parsing
+                print(f"  ⚠️  Raw data is not JSON, trying form-encoded: {e}")
+                print(f"  📥 Raw data preview: {raw_data[:200]}")
+    
+    # If still no data, try form-encoded
+    if not data and request.form:
+        # Convert form data to dict (if sent as form-encoded)
+        form_dict = dict(request.form)
+        if form_dict:
+            # Try to parse as JSON string if it's in form data
+            if 'data' in form_dict:
                 try:
-                    # Try to parse as JSON directly
-                    data = json.loads(raw_data)
-                    print(f"  📥 Parsed JSON from raw data (Content-Type was: {request.content_type})")
-                except Exception as e:
-                    # If not valid JSON, try form-encoded parsing
-                    print(f"  ⚠️  Raw data is not JSON, trying form-encoded: {e}")
-                    print(f"  📥 Raw data preview: {raw_data[:200]}")
-        
-        # If still no data, try form-encoded
-        if not data and request.form:
-            # Convert form data to dict (if sent as form-encoded)
-            form_dict = dict(request.form)
-            if form_dict:
-                # Try to parse as JSON string if it's in form data
-                if 'data' in form_dict:
-                    import json
-                    try:
-                        data = json.loads(form_dict['data'])
-                        print(f"  📥 Parsed JSON from form data")
-                    except:
-                        pass
-        
+                    data = json.loads(form_dict['data'])
+                    print(f"  📥 Parsed JSON from form data")
+                except:
+                    pass
+    
+    if data is not None and not isinstance(data, dict):
+        print(f"  ❌ JSON body must be an object, got {type(data).__name__}")
+        return None
+    
+    if not data:
+        print(f"  ❌ No data provided. Content-Type: {request.content_type}")
+        print(f"  📥 Raw data length: {len(request.get_data(as_text=True))}")
+        print(f"  📥 Raw data preview: {request.get_data(as_text=True)[:200]}")
+    return data
+
+# Account fields και defaults (χρησιμοποιούνται και για delta updates από /api/sync)
+ACCOUNT_FIELDS = {
+    "account_name": 'Unknown',
+    "balance": 0,
+    "equity": 0,
+    "open_trades": [],
+    "daily_profit": 0,
+    "is_running": False,
+    "magic_number": 0,
+    "server": 'Unknown'
+}
+
+def update_account_status(account_id, data, delta=False):
+    """Αποθηκεύει το account status - σε delta mode αλλάζουν μόνο τα fields που στάλθηκαν"""
+    with accounts_lock:
+        existing = accounts_data.get(str(account_id))
+        if delta and existing:
+            account = dict(existing)
+            account.update({key: data[key] for key in ACCOUNT_FIELDS if key in data})
+        else:
+            account = {key: data.get(key, default) for key, default in ACCOUNT_FIELDS.items()}
+        account["account_id"] = account_id
+        account["last_update"] = datetime.now().isoformat()
+        accounts_data[str(account_id)] = account
+        return account
+
+@app.route('/api/account/status', methods=['POST'])
+def receive_account_status():
+    """Δέχεται account status από SignalReceiver instances"""
+    try:
+        data = parse_json_body()
         if not data:
-            print(f"  ❌ No data provided. Content-Type: {request.content_type}")
-            print(f"  📥 Raw data length: {len(request.get_data(as_text=True))}")
-            print(f"  📥 Raw data preview: {request.get_data(as_text=True)[:200]}")
-            return jsonify({"error": "No data provided", "content_type": request.content_type}), 400
+            return jsonify({"error": "No data provided (expected a JSON object)", "content_type": request.content_type}), 400
         
         account_id = data.get('account_id') or data.get('account_number')
         if not account_id:
             return jsonify({"error": "account_id required"}), 400
         
-        with accounts_lock:
-            accounts_data[str(account_id)] = {
-                "account_id": account_id,
-                "account_name": data.get('account_name', 'Unknown'),
-                "balance": data.get('balance', 0),
-                "equity": data.get('equity', 0),
-                "open_trades": data.get('open_trades', []),
-                "daily_profit": data.get('daily_profit', 0),
-                "is_running": data.get('is_running', False),
-                "last_update": datetime.now().isoformat(),
-                "magic_number": data.get('magic_number', 0),
-                "server": data.get('server', 'Unknown')
-            }
+        update_account_status(account_id, data)
         
         print(f"  📊 Account {account_id} status updated")
         return jsonify({"status": "ok", "account_id": account_id}), 200
@@ -343,6 +751,77 @@ def receive_account_status():
         print(f"✗ Error receiving account status: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/sync', methods=['POST'])
+def sync_receiver():
+    """Ένα round trip για τον receiver: account status (ή delta) + last_id -> pending signals + hints"""
+    try:
+        data = parse_json_body()
+        if not data:
+            return jsonify({"error": "No data provided (expected a JSON object)", "content_type": request.content_type}), 400
+        
+        try:
+            last_id = int(data['last_id']) if data.get('last_id') is not None else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "last_id must be an integer"}), 400
+        
+        # Account status is optional - a receiver may sync signals only
+        account_id = data.get('account_id') or data.get('account_number')
+        status_full_required = False
+        if account_id:
+            with accounts_lock:
+                known = str(account_id) in accounts_data
+            delta = bool(data.get('delta'))
+            # A delta for an account we do not know (e.g. after restart) needs a full upload next time
+            status_full_required = delta and not known
+            account = update_account_status(account_id, data, delta=delta)
+        
+        with signal_lock:
+            latest_id = signal_counter
+            if last_id is None or (last_id > signal_counter and server_role != "follower"):
+                # First sync or server id regressed: same semantics as GET /api/signal
+                pending = [dict(latest_signal)] if latest_signal and latest_signal["id"] != last_id else []
+            else:
+                # Backlog signals are only returned when a max age guards them; otherwise only the
+                # latest one, like GET /api/signal, so a reconnect cannot open a pile of old trades
+                pending = [dict(entry) for entry in replication_log
+                           if entry["id"] > last_id and (entry["id"] == signal_counter
+                                                         or max_age_for(parse_signal_fields(entry.get("signal", ""))) > 0)
+                           ][:SYNC_MAX_SIGNALS]
+        
+        signals = []
+        for signal in pending:
+            if check_signal_freshness(signal):
+                signals.append({key: signal[key] for key in ("id", "signal", "age_seconds", "stale") if key in signal})
+            else:
+                print(f"  🗑️  Stale signal #{signal['id']} dropped from sync (age {signal['age_seconds']}s)")
+        
+        next_last_id = pending[-1]["id"] if pending else last_id
+        if account_id:
+            # Correlate delivery with account state: cursor the receiver sent vs what it got now
+            with accounts_lock:
+                account["last_signal_id"] = last_id
+                account["last_delivered_id"] = next_last_id
+                account["last_sync"] = account["last_update"]
+        
+        print(f"  🔄 Sync: account {account_id or '-'}, last_id {last_id}, returning {len(signals)} signal(s)")
+        return jsonify({
+            "status": "ok",
+            "signals": signals,
+            "hints": {
+                "latest_id": latest_id,
+                # Cursor the receiver should send next time (covers dropped stale signals too)
+                "next_last_id": next_last_id,
+                "more_pending": bool(pending) and pending[-1]["id"] < latest_id,
+                "role": server_role,
+                "status_full_required": status_full_required,
+                "poll_interval_ms": SYNC_POLL_INTERVAL_MS or None
+            }
+        }), 200
+        
+    except Exception as e:
+        print(f"✗ Error in sync: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/accounts', methods=['GET'])
 def get_all_accounts():
     """Επιστρέφει όλα τα accounts"""
@@ -680,6 +1159,43 @@ def dashboard():
 </html>
     ''', 200
 
+def server_config():
+    """Settings που αλλάζουν τα responses - γράφονται στο capture και δείχνονται στο /health"""
+    return {
+        "signal_max_age_seconds": SIGNAL_MAX_AGE_SECONDS,
+        "signal_max_age_by_symbol": SIGNAL_MAX_AGE_BY_SYMBOL,
+        "signal_max_age_by_magic": SIGNAL_MAX_AGE_BY_MAGIC,
+        "stale_signal_policy": STALE_SIGNAL_POLICY,
+        "broker_utc_offset_seconds": BROKER_UTC_OFFSET_SECONDS,
+        "skew_min_samples": SKEW_MIN_SAMPLES,
+        "sync_max_signals": SYNC_MAX_SIGNALS,
+        "sync_poll_interval_ms": SYNC_POLL_INTERVAL_MS,
+        "replication_log_size": REPLICATION_LOG_SIZE,
+        "replica_of": REPLICA_OF or None
+    }
+
+# Background threads start on module load, so they also run under `flask run` / a WSGI server
+_background_threads_started = False
+_background_threads_lock = threading.Lock()
+
+def start_background_threads():
+    """Ξεκινάει (μία φορά) τον replication follower και τον capture writer"""
+    global _background_threads_started
+    with _background_threads_lock:
+        if _background_threads_started:
+            return
+        _background_threads_started = True
+    
+    if REPLICA_OF:
+        print(f"🔁 Replication: following {REPLICA_OF}")
+        threading.Thread(target=replication_follower_loop, daemon=True).start()
+    
+    if CAPTURE_FILE:
+        print(f"📼 Traffic capture: ENABLED -> {CAPTURE_FILE}")
+        threading.Thread(target=capture_writer_loop, daemon=True).start()
+
+start_background_threads()
+
 if __name__ == '__main__':
     print("=" * 50)
     print("Simple API Server Started")
@@ -711,13 +1227,20 @@ if __name__ == '__main__':
     print(f"   POST /api/signal        - Receive signals from Bridge Server")
     print(f"   GET  /api/signal        - Get latest signal (for Bridge Client)")
     print(f"   GET  /api/signals/history - Get signal history")
+    print(f"   POST /api/sync          - Receiver sync (status + signals in one request)")
+    print(f"   GET  /api/latency       - Delay percentiles & stale signals")
+    print(f"   GET  /api/replication/log - Signal log for followers")
+    print(f"   POST /api/replication/promote - Promote follower to primary")
     print(f"   GET  /health            - Health check")
     print(f"   GET  /                  - API info")
+    if REPLICA_OF:
+        print(f"🔁 Role: FOLLOWER of {REPLICA_OF} (read-only until promoted)")
+    else:
+        print(f"👑 Role: PRIMARY")
     print("=" * 70)
     print("⏳ Waiting for requests...\n")
     
     # Get port from environment variable (for Render/Heroku) or use default 8080
-    import os
     port = int(os.environ.get('PORT', 8080))
     
     # Run on all interfaces, using PORT from environment or default 8080